@@ -6,12 +6,35 @@ This script downloads a pre-trained FaceNet model and converts it to CoreML form
 for use in iOS applications.
 """
 
+import os
+import platform
+import shutil
+
 import torch
 import torch.nn as nn
 import coremltools as ct
+import coremltools.optimize.coreml as cto
 from facenet_pytorch import InceptionResnetV1
 import numpy as np
 
+OUTPUT_PATH = "DateDate/ML/FaceNet.mlpackage"
+# Optional artifacts live in build/, outside the synchronized DateDate/ Xcode group,
+# so they are not compiled into the app bundle next to FaceNet.mlpackage.
+# 6-bit k-means palettized variant: smallest size, slightly lower accuracy
+PALETTIZED_OUTPUT_PATH = "build/FaceNetPalettized.mlpackage"
+# Precompiled model for distribution outside the app bundle (e.g. on-demand download)
+COMPILED_OUTPUT_PATH = "build/FaceNet.mlmodelc"
+
+# Embedding head ops (last_linear -> last_bn -> F.normalize) kept in fp32.
+# The L2 norm overflows/loses precision in fp16; the convs stay fp16 for the ANE.
+FP32_HEAD_OPS = {"linear", "batch_norm", "reduce_l2_norm", "l2_norm", "maximum", "real_div"}
+
+
+def keep_head_in_fp32(op) -> bool:
+    """op_selector for FP16ComputePrecision: True means cast the op to fp16."""
+    return op.op_type not in FP32_HEAD_OPS
+
+
 def main():
     print("Step 1: Loading pre-trained FaceNet model (VGGFace2)...")
     
@@ -25,8 +48,12 @@ def main():
     # Input shape: (batch_size, 3, 160, 160)
     example_input = torch.randn(1, 3, 160, 160)
     
-    print("Step 3: Tracing the model with TorchScript...")
+    print("Step 3: Tracing and freezing the model with TorchScript...")
     traced_model = torch.jit.trace(model, example_input)
+    # Freezing inlines the weights and folds BatchNorm into the preceding Conv2d,
+    # so ct.convert sees fewer ops. optimize_for_inference is skipped on purpose:
+    # it rewrites convs into MKLDNN ops that coremltools cannot convert.
+    traced_model = torch.jit.freeze(traced_model)
     
     print("Step 4: Converting to CoreML format...")
     
@@ -36,14 +63,18 @@ def main():
         inputs=[
             ct.TensorType(
                 name="input_image",
-                shape=(1, 3, 160, 160),
+                shape=(1, 3, 160, 160),  # Keep fully static (no RangeDim) for an ANE-resident plan
                 dtype=np.float32
             )
         ],
         outputs=[
             ct.TensorType(name="embedding")
         ],
-        minimum_deployment_target=ct.target.iOS15,
+        compute_precision=ct.transform.FP16ComputePrecision(op_selector=keep_head_in_fp32),
+        # Only affects this MLModel's local predictions; it is not saved in the .mlpackage.
+        # On device, MLModelConfiguration.computeUnits (set in FaceNetService.swift) decides.
+        compute_units=ct.ComputeUnit.CPU_AND_NE,
+        minimum_deployment_target=ct.target.iOS16,  # iOS16+ required for compressed weights
         convert_to="mlprogram"  # Use ML Program format for better performance
     )
     
@@ -56,12 +87,53 @@ def main():
     # Add input/output descriptions
     spec = mlmodel.get_spec()
     
-    print("Step 5: Saving CoreML model...")
-    output_path = "DateDate/ML/FaceNet.mlpackage"
-    mlmodel.save(output_path)
+    print("Step 5: Quantizing weights to int8...")
+    # fp16 activations / int8 weights: ~4x less weight bandwidth, ANE friendly
+    quant_config = cto.OptimizationConfig(
+        global_config=cto.OpLinearQuantizerConfig(
+            mode="linear_symmetric",
+            weight_threshold=512
+        ),
+        # Leave the embedding head weights uncompressed
+        op_type_configs={"linear": None}
+    )
+    quantized_model = cto.linear_quantize_weights(mlmodel, quant_config)
+    
+    print("Step 6: Saving CoreML model...")
+    output_path = OUTPUT_PATH
+    quantized_model.save(output_path)
+    
+    print("Step 7: Palettizing weights (6-bit k-means)...")
+    # Palettize from the unquantized model, not on top of the int8 weights
+    palettize_config = cto.OptimizationConfig(
+        global_config=cto.OpPalettizerConfig(nbits=6, mode="kmeans"),
+        op_type_configs={"linear": None}
+    )
+    palettized_model = cto.palettize_weights(mlmodel, palettize_config)
+    os.makedirs(os.path.dirname(PALETTIZED_OUTPUT_PATH), exist_ok=True)
+    palettized_model.save(PALETTIZED_OUTPUT_PATH)
+    
+    compiled_path = None
+    if platform.system() == "Darwin":
+        # Compiling and predicting require the CoreML framework (macOS only)
+        print("Step 8: Pre-compiling and smoke-testing the model...")
+        # MLModel has already compiled the package into a temp .mlmodelc; copy it out.
+        # Remove a previous build first, or copytree fails on the existing directory.
+        if os.path.exists(COMPILED_OUTPUT_PATH):
+            shutil.rmtree(COMPILED_OUTPUT_PATH)
+        shutil.copytree(quantized_model.get_compiled_model_path(), COMPILED_OUTPUT_PATH)
+        compiled_path = COMPILED_OUTPUT_PATH
+        # Smoke-test the compiled model on this build machine. This only warms the
+        # host Mac's CoreML cache; nothing from it ships to or speeds up the device.
+        quantized_model.predict({"input_image": np.zeros((1, 3, 160, 160), np.float32)})
+    else:
+        print("Step 8: Skipping pre-compilation (requires macOS)")
     
     print(f"\n✅ Successfully converted FaceNet to CoreML!")
-    print(f"   Model saved to: {output_path}")
+    print(f"   Model saved to: {output_path} (int8 weights)")
+    print(f"   Palettized model saved to: {PALETTIZED_OUTPUT_PATH} (6-bit weights)")
+    if compiled_path:
+        print(f"   Compiled model saved to: {compiled_path}")
     print(f"\n📝 Model Info:")
     print(f"   - Input: 160x160 RGB image (normalized to [-1, 1])")
     print(f"   - Output: 512-dimensional face embedding")
@@ -16,8 +16,10 @@ import argparse
 import json
 import base64
 import hashlib
-import struct
-from typing import Tuple, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple, Dict, Any, Iterable, List, Optional
 
 try:
     import cbor2
@@ -31,10 +33,76 @@ except ImportError as e:
     exit(1)
 
 
+@lru_cache(maxsize=256)
+def _load_public_key(public_key_bytes: bytes) -> ec.EllipticCurvePublicKey:
+    """Parse a DER public key once per keyId; repeat verifications reuse it."""
+    return serialization.load_der_public_key(public_key_bytes, default_backend())
+
+
+@lru_cache(maxsize=256)
+def _read_public_key_file(path: Path, inode: int, size: int, mtime_ns: int) -> Tuple[bytes, Optional[str]]:
+    if path.suffix == '.json':
+        pk_data = json.loads(path.read_text())
+        # Extract DER from JSON (output of verify_attestation.py)
+        public_key = pk_data.get('publicKey', {})
+        if 'der' in public_key:
+            public_key_bytes = bytes.fromhex(public_key['der'])
+        elif 'derB64' in public_key:
+            public_key_bytes = base64.b64decode(public_key['derB64'])
+        else:
+            raise ValueError("JSON file does not contain publicKey.der field")
+        return public_key_bytes, pk_data.get('keyId', 'N/A')
+    return path.read_bytes(), None
+
+
+def load_public_key_file(path: str) -> Tuple[bytes, Optional[str]]:
+    """
+    Load a DER public key from JSON (verify_attestation.py output) or a raw DER file.
+    
+    Returns (der_bytes, key_id); key_id is None for raw DER files.
+    Cached per (absolute path, inode, size, mtime), so the file is only re-read and
+    re-parsed when it changes; relative paths from different working directories
+    and timestamp-preserving copies (cp -p, rsync, tar) get their own entries.
+    """
+    key_path = Path(path).resolve()
+    st = key_path.stat()
+    return _read_public_key_file(key_path, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _is_json_safe(value: Any) -> bool:
+    """True if value serializes to JSON verbatim (ASCII letters/digits only)."""
+    return isinstance(value, str) and value.isascii() and value.isalnum()
+
+
+def build_request_data(passport_hash: str, evm_address: str) -> bytes:
+    """Serialize the signed payload as compact JSON: {"passportHash":...,"evmAddress":...}."""
+    # Hex hash + 0x address need no escaping, so splice them into a bytes template
+    if _is_json_safe(passport_hash) and _is_json_safe(evm_address):
+        return (b'{"passportHash":"' + passport_hash.encode()
+                + b'","evmAddress":"' + evm_address.encode() + b'"}')
+    payload = {'passportHash': passport_hash, 'evmAddress': evm_address}
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def compute_nonce(auth_data: bytes, request_data: bytes) -> bytes:
+    """Compute nonce = SHA256(authData || SHA256(requestData))."""
+    # hashlib.sha256 is OpenSSL's EVP SHA-256 (SHA-NI / ARMv8 crypto when available);
+    # streaming via update() avoids copying authData into a concatenated buffer.
+    h = hashlib.sha256(auth_data)
+    h.update(hashlib.sha256(request_data).digest())
+    return h.digest()
+
+
+def decode_assertion(assertion_b64: str) -> Dict[str, Any]:
+    """Decode base64 + CBOR assertion into {authenticatorData, signature}."""
+    # cbor2 ships a C decoder (cbor2._cbor2) and uses it automatically when built;
+    # the decoded bytes go straight in without an intermediate copy.
+    return cbor2.loads(base64.b64decode(assertion_b64))
+
+
 def parse_assertion(assertion_b64: str) -> Dict[str, Any]:
     """Parse assertion and extract info."""
-    assertion_data = base64.b64decode(assertion_b64)
-    assertion = cbor2.loads(assertion_data)
+    assertion = decode_assertion(assertion_b64)
     
     auth_data = assertion.get('authenticatorData')
     signature = assertion.get('signature')
@@ -42,7 +110,7 @@ def parse_assertion(assertion_b64: str) -> Dict[str, Any]:
     result = {
         'rp_id_hash': auth_data[:32].hex() if auth_data else None,
         'flags': auth_data[32] if auth_data else None,
-        'counter': struct.unpack('>I', auth_data[33:37])[0] if auth_data else None,
+        'counter': int.from_bytes(auth_data[33:37], 'big') if auth_data else None,
         'signature_length': len(signature) if signature else 0,
         'raw_auth_data': auth_data,
         'raw_signature': signature
@@ -70,27 +138,23 @@ def verify_assertion(
         assertion_b64 = signed_data['assertion']
         
         # Decode assertion
-        assertion_data = base64.b64decode(assertion_b64)
-        assertion = cbor2.loads(assertion_data)
+        assertion = decode_assertion(assertion_b64)
         
         signature = assertion['signature']
         auth_data = assertion['authenticatorData']
         
         # Check counter
-        counter = struct.unpack('>I', auth_data[33:37])[0]
+        counter = int.from_bytes(auth_data[33:37], 'big')
         if counter <= stored_counter:
             return False, stored_counter, f"Replay: counter {counter} <= {stored_counter}"
         
         # Reconstruct signed payload
-        payload = {'passportHash': passport_hash, 'evmAddress': evm_address}
-        request_data = json.dumps(payload, separators=(',', ':')).encode()
+        request_data = build_request_data(passport_hash, evm_address)
         
-        # Compute nonce = SHA256(authData || SHA256(requestData))
-        client_data_hash = hashlib.sha256(request_data).digest()
-        nonce = hashlib.sha256(auth_data + client_data_hash).digest()
+        nonce = compute_nonce(auth_data, request_data)
         
         # Verify ECDSA signature
-        public_key = serialization.load_der_public_key(public_key_bytes, default_backend())
+        public_key = _load_public_key(bytes(public_key_bytes))
         public_key.verify(signature, nonce, ec.ECDSA(hashes.SHA256()))
         
         return True, counter, f"✅ Valid (counter: {counter})"
@@ -101,6 +165,69 @@ def verify_assertion(
         return False, stored_counter, f"❌ Error: {e}"
 
 
+# Per-worker state for verify_many, set once by _init_worker
+_worker_public_key_bytes = b''
+_worker_stored_counter = 0
+
+
+def _init_worker(public_key_bytes: bytes, stored_counter: int):
+    global _worker_public_key_bytes, _worker_stored_counter
+    _worker_public_key_bytes = public_key_bytes
+    _worker_stored_counter = stored_counter
+    try:
+        _load_public_key(public_key_bytes)  # Parse DER once per worker
+    except Exception:
+        pass  # Reported per record by verify_assertion; never break the pool
+
+
+def _verify_one(signed_data: Dict[str, Any]) -> Tuple[bool, int, str]:
+    return verify_assertion(signed_data, _worker_public_key_bytes, _worker_stored_counter)
+
+
+def verify_many(
+    records: Iterable[Dict[str, Any]],
+    public_key_bytes: bytes,
+    stored_counter: int = 0,
+    max_workers: Optional[int] = None,
+    chunksize: int = 64
+) -> Tuple[List[Tuple[bool, int, str]], int]:
+    """
+    Verify many assertions for one key in parallel across processes.
+    
+    Args:
+        records: Signed data dicts, same shape as verify_assertion's signed_data, in submission order
+        public_key_bytes: Public key in DER format
+        stored_counter: Previous counter for replay protection
+        max_workers: Worker process count (default: CPU count)
+        chunksize: Records sent to a worker per task
+    
+    Returns (results, new_counter). results holds one verify_assertion tuple per
+    record, in input order. Counters are chained in that order: a record is only
+    accepted if its counter is above the highest counter accepted before it, so a
+    replayed assertion within the batch fails. new_counter is the highest accepted
+    counter (stored_counter if none were accepted).
+    """
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(bytes(public_key_bytes), stored_counter)
+    ) as executor:
+        signature_results = list(executor.map(_verify_one, records, chunksize=chunksize))
+    
+    # Signatures are checked in parallel; replay protection needs the ordered pass
+    results = []
+    highest_counter = stored_counter
+    for is_valid, counter, message in signature_results:
+        if not is_valid:
+            results.append((False, highest_counter, message))
+        elif counter <= highest_counter:
+            results.append((False, highest_counter, f"Replay: counter {counter} <= {highest_counter}"))
+        else:
+            highest_counter = counter
+            results.append((True, counter, message))
+    return results, highest_counter
+
+
 def main():
     parser = argparse.ArgumentParser(description="Verify App Attest assertion")
     parser.add_argument('--json', type=str, required=True, help='Signed data JSON file')
@@ -139,23 +266,13 @@ def main():
         return
     
     # Load public key (supports JSON from verify_attestation.py or raw DER)
-    public_key_bytes = None
-    if args.public_key.endswith('.json'):
-        with open(args.public_key, 'r') as f:
-            pk_data = json.load(f)
-        # Extract DER from JSON (output of verify_attestation.py)
-        if 'publicKey' in pk_data and 'der' in pk_data['publicKey']:
-            public_key_bytes = bytes.fromhex(pk_data['publicKey']['der'])
-            print(f"ℹ️  Loaded public key from JSON (keyId: {pk_data.get('keyId', 'N/A')})")
-        elif 'publicKey' in pk_data and 'derB64' in pk_data['publicKey']:
-            public_key_bytes = base64.b64decode(pk_data['publicKey']['derB64'])
-            print(f"ℹ️  Loaded public key from JSON (keyId: {pk_data.get('keyId', 'N/A')})")
-        else:
-            print("❌ JSON file does not contain publicKey.der field")
-            return
-    else:
-        with open(args.public_key, 'rb') as f:
-            public_key_bytes = f.read()
+    try:
+        public_key_bytes, key_id = load_public_key_file(args.public_key)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if key_id is not None:
+        print(f"ℹ️  Loaded public key from JSON (keyId: {key_id})")
     
     is_valid, new_counter, message = verify_assertion(signed_data, public_key_bytes, args.counter)
     print(f"\nResult: {message}")
@@ -15,9 +15,10 @@ Usage:
 import argparse
 import base64
 import hashlib
-import struct
+import hmac
 import json
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional, List, Tuple
 
 try:
@@ -26,6 +27,7 @@ try:
     from cryptography.hazmat.primitives import serialization
     from cryptography.hazmat.primitives.asymmetric import ec
     from cryptography.hazmat.backends import default_backend
+    from cryptography.exceptions import InvalidSignature
     from cryptography.x509.oid import ObjectIdentifier
 except ImportError as e:
     print(f"Missing dependency: {e}")
@@ -48,7 +50,20 @@ CgYIKoZIzj0EAwMDaAAwZQIwQgFGnByvsiVbpTKwSga0kP0e8EeDS4+sQmTvb7vn
 oyFraWVIyd/dganmrduC1bmTBGwD
 -----END CERTIFICATE-----"""
 
+# Parsed once at import; every verification checks against the same root
+APPLE_ROOT_CA = x509.load_pem_x509_certificate(APPLE_ROOT_CA_PEM, default_backend())
+APPLE_ROOT_CA_PUBLIC_KEY = APPLE_ROOT_CA.public_key()
+
+# SubjectPublicKeyInfo header for an uncompressed P-256 point:
+# SEQUENCE {
+#   SEQUENCE { OID(ecPublicKey 1.2.840.10045.2.1), OID(prime256v1 1.2.840.10045.3.1.7) }
+#   BIT STRING { 0x00 unused bits, 0x04 || X || Y }
+# }
+P256_SPKI_PREFIX = bytes.fromhex('3059301306072a8648ce3d020106082a8648ce3d03010703420004')
+
 APPLE_NONCE_OID = ObjectIdentifier("1.2.840.113635.100.8.2")
+# DER header preceding the nonce: SEQUENCE, [1] EXPLICIT, OCTET STRING (32 bytes)
+NONCE_EXTENSION_PREFIX = bytes.fromhex('3024a1220420')
 
 
 @dataclass
@@ -95,45 +110,27 @@ class VerificationResult:
         print("="*60)
 
 
+@lru_cache(maxsize=16)
+def _load_intermediate(der_bytes: bytes) -> x509.Certificate:
+    """Parse an intermediate cert; Apple uses only a handful, so memoize them."""
+    return x509.load_der_x509_certificate(der_bytes, default_backend())
+
+
+@lru_cache(maxsize=8)
+def _rp_hash(team_id: str, bundle_id: str) -> bytes:
+    """RP ID hash = SHA256(App ID); an app has only one or two App IDs."""
+    return hashlib.sha256(f"{team_id}.{bundle_id}".encode()).digest()
+
+
 def extract_nonce_from_extension(payload: bytes) -> bytes:
-    """Extract 32-byte nonce from Apple attestation extension."""
-    def find_octet32(b: bytes, depth: int = 0) -> Optional[bytes]:
-        if depth > 10 or len(b) < 2:
-            return None
-        i = 0
-        while i < len(b):
-            if i >= len(b):
-                break
-            tag = b[i]
-            i += 1
-            if i >= len(b):
-                break
-            length = b[i]
-            i += 1
-            if length & 0x80:
-                n = length & 0x7F
-                if i + n > len(b):
-                    break
-                length = int.from_bytes(b[i:i+n], 'big')
-                i += n
-            if i + length > len(b):
-                break
-            value = b[i:i+length]
-            i += length
-            # OCTET STRING with 32 bytes
-            if tag == 0x04 and len(value) == 32:
-                return value
-            # Recurse into constructed types
-            if tag & 0x20 or tag in (0x30, 0x31, 0x04):
-                result = find_octet32(value, depth + 1)
-                if result:
-                    return result
-        return None
-    
-    result = find_octet32(payload)
-    if result is None:
+    """Extract 32-byte nonce from Apple attestation extension.
+
+    The extension has a fixed DER shape, so the nonce sits at a known offset:
+    SEQUENCE (30 24) { [1] EXPLICIT (A1 22) { OCTET STRING (04 20) nonce } }
+    """
+    if len(payload) != len(NONCE_EXTENSION_PREFIX) + 32 or not payload.startswith(NONCE_EXTENSION_PREFIX):
         raise ValueError("Could not find 32-byte nonce in extension")
-    return result
+    return payload[len(NONCE_EXTENSION_PREFIX):]
 
 
 def verify_attestation(
@@ -171,13 +168,13 @@ def verify_attestation(
         # 2. Parse authData
         rp_id_hash = auth_data[:32]
         flags = auth_data[32]
-        sign_count = struct.unpack('>I', auth_data[33:37])[0]
+        sign_count = int.from_bytes(auth_data[33:37], 'big')
         aaguid = auth_data[37:53]
-        cred_id_len = struct.unpack('>H', auth_data[53:55])[0]
+        cred_id_len = int.from_bytes(auth_data[53:55], 'big')
         credential_id = auth_data[55:55+cred_id_len]
         
         # 3. Verify rpIdHash
-        expected_rp_hash = hashlib.sha256(f"{team_id}.{bundle_id}".encode()).digest()
+        expected_rp_hash = _rp_hash(team_id, bundle_id)
         if rp_id_hash != expected_rp_hash:
             errors.append(f"rpIdHash mismatch")
         
@@ -196,38 +193,40 @@ def verify_attestation(
         
         # 7. Load and verify certificate chain
         leaf_cert = x509.load_der_x509_certificate(x5c[0], default_backend())
-        intermediate = x509.load_der_x509_certificate(x5c[1], default_backend())
-        root_ca = x509.load_pem_x509_certificate(APPLE_ROOT_CA_PEM, default_backend())
+        intermediate = _load_intermediate(bytes(x5c[1]))
         
-        # Verify signatures
+        # Verify signatures (root -> intermediate -> leaf) in a single try
+        signed_cert = "Intermediate"
         try:
-            root_ca.public_key().verify(
+            APPLE_ROOT_CA_PUBLIC_KEY.verify(
                 intermediate.signature,
                 intermediate.tbs_certificate_bytes,
                 ec.ECDSA(intermediate.signature_hash_algorithm)
             )
-        except Exception as e:
-            errors.append(f"Intermediate cert signature invalid: {e}")
-        
-        try:
+            signed_cert = "Leaf"
             intermediate.public_key().verify(
                 leaf_cert.signature,
                 leaf_cert.tbs_certificate_bytes,
                 ec.ECDSA(leaf_cert.signature_hash_algorithm)
             )
-        except Exception as e:
-            errors.append(f"Leaf cert signature invalid: {e}")
+        except InvalidSignature:
+            errors.append(f"{signed_cert} cert signature invalid")
         
         # 8. Extract public key from leaf cert
         leaf_pk = leaf_cert.public_key()
         if not isinstance(leaf_pk, ec.EllipticCurvePublicKey):
             errors.append("Leaf cert public key is not EC")
             return VerificationResult(False, None, None, None, None, None, credential_id, errors)
+        if not isinstance(leaf_pk.curve, ec.SECP256R1):
+            errors.append(f"Leaf cert public key is not P-256 (got {leaf_pk.curve.name})")
+            return VerificationResult(False, None, None, None, None, None, credential_id, errors)
         
-        nums = leaf_pk.public_numbers()
-        x_bytes = nums.x.to_bytes(32, 'big')
-        y_bytes = nums.y.to_bytes(32, 'big')
-        uncompressed = b'\x04' + x_bytes + y_bytes
+        uncompressed = leaf_pk.public_bytes(
+            serialization.Encoding.X962,
+            serialization.PublicFormat.UncompressedPoint
+        )
+        x_bytes = uncompressed[1:33]
+        y_bytes = uncompressed[33:65]
         key_id = hashlib.sha256(uncompressed).digest()
         key_id_b64 = base64.b64encode(key_id).decode()
         
@@ -241,28 +240,32 @@ def verify_attestation(
             payload = ext.value.value if hasattr(ext.value, 'value') else bytes(ext.value)
             cert_nonce = extract_nonce_from_extension(payload)
             
-            # Try both nonce computation methods:
+            # Try both nonce computation methods, cheapest/most common first.
+            # Hash the shared authData prefix once and branch the two suffixes.
+            auth_data_hash = hashlib.sha256(auth_data)
             # Method 1: nonce = SHA256(authData || challenge)
-            expected_nonce_1 = hashlib.sha256(auth_data + challenge).digest()
-            # Method 2: nonce = SHA256(authData || SHA256(challenge))
-            client_data_hash = hashlib.sha256(challenge).digest()
-            expected_nonce_2 = hashlib.sha256(auth_data + client_data_hash).digest()
+            h1 = auth_data_hash.copy()
+            h1.update(challenge)
+            expected_nonce_1 = h1.digest()
             
-            if cert_nonce == expected_nonce_1:
-                pass  # Method 1 matched
-            elif cert_nonce == expected_nonce_2:
-                pass  # Method 2 matched
-            else:
-                errors.append("Nonce mismatch")
-                print(f"\n🔍 Debug - Nonce comparison:")
-                print(f"   Cert nonce:     {cert_nonce.hex()}")
-                print(f"   Expected (m1):  {expected_nonce_1.hex()}  # SHA256(authData || challenge)")
-                print(f"   Expected (m2):  {expected_nonce_2.hex()}  # SHA256(authData || SHA256(challenge))")
-                print(f"   Challenge:      {challenge}")
-                print(f"   AuthData len:   {len(auth_data)}")
+            if not hmac.compare_digest(cert_nonce, expected_nonce_1):
+                # Method 2: nonce = SHA256(authData || SHA256(challenge))
+                client_data_hash = hashlib.sha256(challenge).digest()
+                h2 = auth_data_hash.copy()
+                h2.update(client_data_hash)
+                expected_nonce_2 = h2.digest()
+                
+                if not hmac.compare_digest(cert_nonce, expected_nonce_2):
+                    errors.append("Nonce mismatch")
+                    print(f"\n🔍 Debug - Nonce comparison:")
+                    print(f"   Cert nonce:     {cert_nonce.hex()}")
+                    print(f"   Expected (m1):  {expected_nonce_1.hex()}  # SHA256(authData || challenge)")
+                    print(f"   Expected (m2):  {expected_nonce_2.hex()}  # SHA256(authData || SHA256(challenge))")
+                    print(f"   Challenge:      {challenge}")
+                    print(f"   AuthData len:   {len(auth_data)}")
         except x509.ExtensionNotFound:
             errors.append("Nonce extension not found")
-        except Exception as e:
+        except ValueError as e:
             errors.append(f"Nonce verification error: {e}")
         
         ok = len(errors) == 0
@@ -284,38 +287,10 @@ def verify_attestation(
 
 def build_der_public_key(x: bytes, y: bytes) -> bytes:
     """Build DER-encoded SubjectPublicKeyInfo for EC P-256 public key."""
-    # Uncompressed point: 0x04 || X || Y
-    point = b'\x04' + x + y
-    
-    # EC public key DER structure:
-    # SEQUENCE {
-    #   SEQUENCE { OID(ecPublicKey), OID(prime256v1) }
-    #   BIT STRING { uncompressed point }
-    # }
-    ec_public_key_oid = bytes.fromhex('2a8648ce3d0201')  # 1.2.840.10045.2.1
-    prime256v1_oid = bytes.fromhex('2a8648ce3d030107')  # 1.2.840.10045.3.1.7
-    
-    def der_len(length: int) -> bytes:
-        if length < 128:
-            return bytes([length])
-        elif length < 256:
-            return bytes([0x81, length])
-        else:
-            return bytes([0x82, length >> 8, length & 0xff])
-    
-    # Algorithm identifier sequence
-    algo_seq = b'\x30' + der_len(len(ec_public_key_oid) + len(prime256v1_oid) + 4)
-    algo_seq += b'\x06' + der_len(len(ec_public_key_oid)) + ec_public_key_oid
-    algo_seq += b'\x06' + der_len(len(prime256v1_oid)) + prime256v1_oid
-    
-    # Bit string (with 0 unused bits prefix)
-    bit_string = b'\x03' + der_len(len(point) + 1) + b'\x00' + point
-    
-    # Outer sequence
-    inner = algo_seq + bit_string
-    der = b'\x30' + der_len(len(inner)) + inner
-    
-    return der
+    if len(x) != 32 or len(y) != 32:
+        raise ValueError("P-256 coordinates must be 32 bytes each")
+    # Fixed 91-byte layout; only the uncompressed point's X || Y varies
+    return P256_SPKI_PREFIX + x + y
 
 
 def save_public_key(result: VerificationResult, output_path: str):